@@ -0,0 +1,2 @@
+# Frontend origins allowed to call the API (CORS) and to open chat WebSockets
+ALLOWED_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
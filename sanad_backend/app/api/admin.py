@@ -0,0 +1,32 @@
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel, Field
+from .. import profiling
+
+router = APIRouter()
+
+# Data validation for incoming profiling settings
+class ProfilingSettingsIn(BaseModel):
+    sample_rate: float = Field(ge=0.0, le=1.0)
+
+# Data validation for outgoing profiling settings
+class ProfilingSettingsOut(BaseModel):
+    sample_rate: float
+    available: bool  # False when pyinstrument is not installed
+
+def require_admin(token: Optional[str]):
+    if not profiling.is_admin_token(token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@router.get("/admin/profiling", response_model=ProfilingSettingsOut)
+def get_profiling_settings(x_sanad_profile: Optional[str] = Header(default=None)):
+    require_admin(x_sanad_profile)
+    return ProfilingSettingsOut(sample_rate=profiling.get_sample_rate(), available=profiling.is_available())
+
+@router.put("/admin/profiling", response_model=ProfilingSettingsOut)
+def update_profiling_settings(settings: ProfilingSettingsIn, x_sanad_profile: Optional[str] = Header(default=None)):
+    """Change the fraction of /message requests that are profiled."""
+    require_admin(x_sanad_profile)
+    if not profiling.is_available():
+        raise HTTPException(status_code=503, detail="Profiling unavailable: install pyinstrument")
+    return ProfilingSettingsOut(sample_rate=profiling.set_sample_rate(settings.sample_rate), available=True)
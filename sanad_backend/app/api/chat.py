@@ -1,13 +1,23 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, ValidationError
+from .. import ALLOWED_ORIGINS
 from ..services.ai_service import analyze_sentiment_and_risk, analyze_mental_health_context
 from ..services.conversation_store import (
     get_conversation_context, 
+    format_conversation_context,
+    load_conversation_history,
     save_conversation, 
+    save_conversation_turns,
     learn_from_conversation,
+    learn_from_conversation_turns,
     get_learned_responses
 )
-from ..services.ai_api_service import get_ai_response
+from ..services.ai_api_service import get_ai_response, get_routing_metrics
+from ..services.risk_state import RiskState, get_risk_state, save_risk_state, pin_risk_state, unpin_risk_state
 
 router = APIRouter()
 
@@ -21,23 +31,54 @@ class MessageOut(BaseModel):
     response_text: str
     action: str  # e.g., 'CONTINUE_CHAT', 'EMERGENCY_TRIGGERED'
 
+# Data validation for incoming WebSocket frames (session id comes from the URL)
+class WsMessageIn(BaseModel):
+    text: str
+    stream: bool = False  # Send the finished reply in paragraph "delta" frames before the final "response" frame
+
+CONTEXT_TURNS = 5
+PERSIST_QUEUE_SIZE = 32  # Backpressure: a connection waits if storage falls this far behind
+
 @router.post("/message", response_model=MessageOut)
 async def handle_user_message(msg: MessageIn):
     # 1. Get conversation history and context
-    conversation_context = get_conversation_context(msg.session_id, last_n=5)
+    conversation_context = get_conversation_context(msg.session_id, last_n=CONTEXT_TURNS)
+    risk_state = get_risk_state(msg.session_id)
+    
+    response_text, action, context_data = generate_reply(msg.text, conversation_context, risk_state)
+    
+    # 7. Save conversation, risk state and learn from it
+    save_conversation(msg.session_id, msg.text, response_text, context_data)
+    save_risk_state(msg.session_id, risk_state)
+    learn_from_conversation(msg.session_id, msg.text, response_text)
     
+    return MessageOut(response_text=response_text, action=action)
+
+def generate_reply(text: str, conversation_context: str, risk_state: Optional[RiskState] = None) -> Tuple[str, str, Dict]:
+    """
+    Analyze a message and build the therapeutic reply. Returns (response_text, action, context_data).
+    The session's risk state, if given, is updated with this turn.
+    """
     # 2. AI Analysis - Sentiment and Risk
-    ai_data = analyze_sentiment_and_risk(msg.text)
+    ai_data = analyze_sentiment_and_risk(text)
     risk_score = ai_data["risk_score"]
     sentiment = ai_data["sentiment"]
     
     # 3. Mental Health Context Analysis
-    health_context = analyze_mental_health_context(msg.text)
+    health_context = analyze_mental_health_context(text)
     conditions = health_context["conditions"]
     severity = health_context["severity"]
     concerns = health_context["concerns"]
+    is_crisis = risk_score >= 0.95 or health_context["needs_immediate_attention"]
+    
+    # Fold this turn into the session's risk history and share it with the API prompt
+    if risk_state:
+        risk_state.update(risk_score, conditions, is_crisis)
+        risk_summary = risk_state.prompt_summary()
+        if risk_summary:
+            conversation_context = f"{conversation_context}\n\n{risk_summary}".strip()
     
-    text_lower = msg.text.lower().strip()
+    text_lower = text.lower().strip()
     
     # 4. Check for learned patterns
     key_phrases = [phrase for phrase in ["i feel", "i'm feeling", "i have", "depression", "anxious"] if phrase in text_lower]
@@ -47,7 +88,7 @@ async def handle_user_message(msg: MessageIn):
     
     # 5. Try to get AI API response first (if configured)
     api_response = get_ai_response(
-        user_message=msg.text,
+        user_message=text,
         conversation_context=conversation_context,
         mental_health_context=health_context,
         learned_patterns=learned_responses[:2] if learned_responses else None
@@ -58,7 +99,7 @@ async def handle_user_message(msg: MessageIn):
     action = "CONTINUE_CHAT"
     
     # CRISIS INTERVENTION - Highest Priority (always use rule-based for safety)
-    if risk_score >= 0.95 or health_context["needs_immediate_attention"]:
+    if is_crisis:
         response_text = "⚠️ **CRISIS SUPPORT:** I'm deeply concerned about your safety. Your life has value and meaning. Please reach out immediately:\n\n• National Suicide Prevention Lifeline: 988 (US)\n• Crisis Text Line: Text HOME to 741741\n• Emergency Services: 911\n\nYou don't have to face this alone. Professional help is available right now."
         action = "EMERGENCY_TRIGGERED"
     
@@ -110,7 +151,7 @@ async def handle_user_message(msg: MessageIn):
         
         # POSITIVE RESPONSES TO OFFERS
         elif any(word in text_lower for word in ["yes", "sure", "ok", "okay", "yeah", "yep", "alright", "let's", "let us"]):
-            if "breathing" in text_lower or "exercise" in text_lower or len(msg.text) < 10:
+            if "breathing" in text_lower or "exercise" in text_lower or len(text) < 10:
                 response_text = "Excellent. Let's practice deep breathing together. This activates your body's relaxation response.\n\n**Step 1:** Find a comfortable seated or lying position.\n**Step 2:** Close your eyes if comfortable, or soften your gaze.\n**Step 3:** Breathe in slowly through your nose for 4 counts... (1... 2... 3... 4...)\n**Step 4:** Hold your breath for 4 counts... (1... 2... 3... 4...)\n**Step 5:** Exhale slowly through your mouth for 6 counts... (1... 2... 3... 4... 5... 6...)\n\nRepeat this cycle 5-10 times. Notice how your body feels. I'm here with you."
                 action = "GUIDED_EXERCISE"
             else:
@@ -151,7 +192,12 @@ async def handle_user_message(msg: MessageIn):
                 response_text = "I'm listening. Can you tell me more about what you're experiencing or what's on your mind? Understanding your situation better helps me provide more targeted support."
             action = "CONTINUE_CHAT"
     
-    # 7. Save conversation and learn from it
+    # SUSTAINED RISK - The conversation as a whole is concerning, even if this message is not a crisis
+    if risk_state and not is_crisis and risk_state.should_check_in():
+        response_text += "\n\nI've noticed things have felt heavy for a while in our conversation. How are you doing right now, and are you safe? If it ever feels like too much, you can call or text 988 (US) any time."
+        if action == "CONTINUE_CHAT":
+            action = "RISK_CHECK_IN"
+    
     context_data = {
         "sentiment": sentiment,
         "risk_score": risk_score,
@@ -159,7 +205,89 @@ async def handle_user_message(msg: MessageIn):
         "severity": severity,
         "concerns": concerns
     }
-    save_conversation(msg.session_id, msg.text, response_text, context_data)
-    learn_from_conversation(msg.session_id, msg.text, response_text)
+    if risk_state:
+        context_data["session_risk_ewma"] = round(risk_state.risk_ewma, 2)
+    return response_text, action, context_data
+
+@router.get("/router/metrics")
+def local_llm_routing_metrics():
+    """Local LLM routing decisions and per-model latency EWMAs."""
+    return get_routing_metrics()
+
+def _persist_turns_batch(session_id: str, turns: list, risk_state: RiskState):
+    save_conversation_turns(session_id, turns)
+    save_risk_state(session_id, risk_state)
+    learn_from_conversation_turns(session_id, [(text, response_text) for text, response_text, _ in turns])
+
+async def _persist_turns(session_id: str, queue: asyncio.Queue, risk_state: RiskState):
+    """Persist turns in arrival order, off the event loop. Turns queued meanwhile are written together."""
+    while True:
+        turns = [await queue.get()]
+        while not queue.empty():
+            turns.append(queue.get_nowait())
+        try:
+            await asyncio.to_thread(_persist_turns_batch, session_id, turns, risk_state)
+        except Exception as e:
+            print(f"Conversation persistence error: {e}")
+        finally:
+            for _ in turns:
+                queue.task_done()
+
+@router.websocket("/ws/{session_id}")
+async def chat_websocket(websocket: WebSocket, session_id: str):
+    """
+    Chat over a single connection. Recent turns (with their analysis) and the risk state are
+    loaded once and kept in memory; messages are processed in order and persisted in the background.
+    """
+    # CORS does not apply to WebSockets, so browsers let any page open this socket; check its origin.
+    # Non-browser clients send no Origin header and are not affected by cross-site requests.
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in ALLOWED_ORIGINS:
+        await websocket.close(code=1008)
+        return
     
-    return MessageOut(response_text=response_text, action=action)
+    await websocket.accept()
+    # Disk reads (and decryption) happen off the event loop, like reply generation below
+    history = await asyncio.to_thread(load_conversation_history, session_id, CONTEXT_TURNS)
+    recent_turns = deque(history, maxlen=CONTEXT_TURNS)
+    risk_state = await asyncio.to_thread(pin_risk_state, session_id)  # Shared with POST requests for this session while connected
+    persist_queue: asyncio.Queue = asyncio.Queue(maxsize=PERSIST_QUEUE_SIZE)
+    writer = asyncio.create_task(_persist_turns(session_id, persist_queue, risk_state))
+    
+    try:
+        while True:
+            try:
+                msg = WsMessageIn.model_validate_json(await websocket.receive_text())
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": e.errors(include_url=False)})
+                continue
+            
+            # Model inference and LLM calls block; run them off the event loop so other
+            # connections keep being served. Awaiting here keeps this connection's turns in order.
+            response_text, action, context_data = await asyncio.to_thread(
+                generate_reply, msg.text, format_conversation_context(list(recent_turns)), risk_state
+            )
+            
+            if msg.stream:
+                paragraphs = response_text.split("\n\n")
+                for i, paragraph in enumerate(paragraphs):
+                    separator = "\n\n" if i < len(paragraphs) - 1 else ""
+                    await websocket.send_json({"type": "delta", "text": paragraph + separator})
+            await websocket.send_json({"type": "response", "response_text": response_text, "action": action})
+            
+            recent_turns.append({
+                "timestamp": datetime.now().isoformat(),
+                "user_message": msg.text,
+                "bot_response": response_text,
+                "context": context_data,
+            })
+            await persist_queue.put((msg.text, response_text, context_data))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Flush pending turns before dropping the connection state
+        try:
+            await persist_queue.join()
+            writer.cancel()
+        finally:
+            unpin_risk_state(session_id)
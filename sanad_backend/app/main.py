@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api import chat
+from . import ALLOWED_ORIGINS
+from .api import chat, admin
+from .profiling import ProfilingMiddleware
 
 app = FastAPI(
     title="Sanad AI Backend",
@@ -10,14 +12,18 @@ app = FastAPI(
 # Configure CORS to allow frontend requests
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Opt-in profiling of sampled /api/v1/message requests (see app/profiling.py)
+app.add_middleware(ProfilingMiddleware)
+
 # Prefix all API routes with /api/v1
 app.include_router(chat.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,120 @@
+"""
+Opt-in request profiling for the chat endpoint.
+Profiles a sampled fraction of POST /api/v1/message requests (or requests carrying the
+admin profiling header) with pyinstrument and writes speedscope flamegraphs to a
+rotating local directory.
+
+Profiles only contain code locations and timings. The middleware never reads the
+request body, and file names carry no session ids, so message contents are never
+written to disk.
+"""
+import asyncio
+import hmac
+import os
+import random
+import time
+from typing import Optional
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:
+    Profiler = None
+
+# Configuration
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # 0.0 - 1.0
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_HEADER = "x-sanad-profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("conversation_data", "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_INTERVAL_S = float(os.getenv("PROFILE_INTERVAL_S", "0.001"))
+PROFILED_PATHS = ("/api/v1/message",)
+
+_sample_rate = PROFILE_SAMPLE_RATE
+
+
+def is_available() -> bool:
+    """Whether the profiler (pyinstrument) is installed."""
+    return Profiler is not None
+
+
+def get_sample_rate() -> float:
+    return _sample_rate
+
+
+def set_sample_rate(rate: float) -> float:
+    """Change the sampling rate at runtime (clamped to 0.0 - 1.0)."""
+    global _sample_rate
+    _sample_rate = min(max(rate, 0.0), 1.0)
+    return _sample_rate
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Check an admin profiling token. Always False when no token is configured."""
+    if not PROFILE_ADMIN_TOKEN or not token:
+        return False
+    # Compare bytes: compare_digest rejects non-ASCII str, and headers are latin-1
+    return hmac.compare_digest(token.encode("latin-1", errors="replace"), PROFILE_ADMIN_TOKEN.encode("utf-8"))
+
+
+def _header(scope, name: str) -> Optional[str]:
+    encoded = name.encode("latin-1")
+    for key, value in scope.get("headers", ()):
+        if key == encoded:
+            return value.decode("latin-1")
+    return None
+
+
+def _rotate_profiles():
+    """Keep only the newest PROFILE_MAX_FILES profiles."""
+    profiles = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".speedscope.json")),
+        key=lambda entry: entry.name,
+    )
+    for entry in profiles[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else profiles:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _write_profile(profiler, path: str, duration_s: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = path.strip("/").replace("/", "_")
+    filename = f"{time.strftime('%Y%m%dT%H%M%S')}_{time.time_ns() % 1_000_000_000:09d}_{slug}_{int(duration_s * 1000)}ms.speedscope.json"
+    with open(os.path.join(PROFILE_DIR, filename), "w", encoding="utf-8") as f:
+        f.write(profiler.output(renderer=SpeedscopeRenderer()))
+    _rotate_profiles()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware. When sampling is off and no admin header is sent, it adds one comparison per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # POST only: CORS preflight (OPTIONS) requests reach this middleware first and would waste profile slots
+        if (Profiler is None or scope["type"] != "http" or scope["method"] != "POST"
+                or scope["path"] not in PROFILED_PATHS or not self._should_profile(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = Profiler(interval=PROFILE_INTERVAL_S, async_mode="enabled")
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            try:
+                # Rendering and writing happen off the event loop so other requests are not delayed
+                await asyncio.to_thread(_write_profile, profiler, scope["path"], time.perf_counter() - started)
+            except Exception as e:
+                print(f"Profiler output error: {e}")
+
+    @staticmethod
+    def _should_profile(scope) -> bool:
+        if _sample_rate > 0 and random.random() < _sample_rate:
+            return True
+        return PROFILE_ADMIN_TOKEN != "" and is_admin_token(_header(scope, PROFILE_HEADER))
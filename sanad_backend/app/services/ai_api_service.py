@@ -3,7 +3,9 @@ AI API Service - Integrates with external APIs for intelligent responses.
 Supports OpenAI API, local LLM models, and Hugging Face Inference API.
 """
 import os
-from typing import Optional, Dict
+import threading
+import time
+from typing import Optional, Dict, Tuple
 import requests
 
 # Configuration
@@ -11,6 +13,23 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 USE_OPENAI = os.getenv("USE_OPENAI", "false").lower() == "true"
 USE_LOCAL_LLM = os.getenv("USE_LOCAL_LLM", "false").lower() == "true"
 LOCAL_LLM_URL = os.getenv("LOCAL_LLM_URL", "http://localhost:11434")  # For Ollama or similar
+LOCAL_LLM_TIMEOUT_S = 30
+
+# Local LLM model routing
+LOCAL_LLM_STRONG_MODEL = os.getenv("LOCAL_LLM_STRONG_MODEL", "llama2")
+LOCAL_LLM_FAST_MODEL = os.getenv("LOCAL_LLM_FAST_MODEL", "phi3")
+ROUTER_SHORT_MESSAGE_WORDS = int(os.getenv("ROUTER_SHORT_MESSAGE_WORDS", "8"))
+ROUTER_LATENCY_BUDGET_S = float(os.getenv("ROUTER_LATENCY_BUDGET_S", "10"))
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+ROUTER_PROBE_EVERY = max(1, int(os.getenv("ROUTER_PROBE_EVERY", "10")))  # Re-sample the strong model while over budget
+
+_router_lock = threading.Lock()
+_model_latency_ewma: Dict[str, float] = {}
+_routing_metrics = {
+    "decisions": {},  # reason -> count
+    "over_budget_turns": 0,
+    "models": {},  # model -> {"requests", "errors", "latency_ewma_s", "last_latency_s"}
+}
 
 def get_ai_response(
     user_message: str,
@@ -115,6 +134,79 @@ Guidelines:
         print(f"OpenAI API error: {e}")
         return None
 
+def choose_local_model(user_message: str, mental_health_context: Dict = None) -> Tuple[str, str]:
+    """
+    Pick the local model for this turn.
+    
+    Returns:
+        (model name, routing reason)
+    """
+    mental_health_context = mental_health_context or {}
+    conditions = mental_health_context.get("conditions", [])
+    
+    # High-severity turns always get the stronger model
+    if mental_health_context.get("needs_immediate_attention") or mental_health_context.get("severity") == "high":
+        return LOCAL_LLM_STRONG_MODEL, "high_severity_override"
+    
+    if conditions:
+        return LOCAL_LLM_STRONG_MODEL, "clinical_context"
+    
+    short_message = len(user_message.split()) <= ROUTER_SHORT_MESSAGE_WORDS
+    
+    # Prefer the fast model for short turns and the strong one otherwise, unless the preferred
+    # model is over the latency budget (slow, failing or timing out) and the other one is faster
+    with _router_lock:
+        strong_latency = _model_latency_ewma.get(LOCAL_LLM_STRONG_MODEL)
+        fast_latency = _model_latency_ewma.get(LOCAL_LLM_FAST_MODEL)
+        if short_message:
+            if (fast_latency is None or fast_latency <= ROUTER_LATENCY_BUDGET_S
+                    or (strong_latency is not None and strong_latency >= fast_latency)):
+                return LOCAL_LLM_FAST_MODEL, "short_message"
+            preferred, fallback = LOCAL_LLM_FAST_MODEL, LOCAL_LLM_STRONG_MODEL
+        elif (strong_latency is not None and strong_latency > ROUTER_LATENCY_BUDGET_S
+                and (fast_latency is None or fast_latency < strong_latency)):
+            preferred, fallback = LOCAL_LLM_STRONG_MODEL, LOCAL_LLM_FAST_MODEL
+        else:
+            return LOCAL_LLM_STRONG_MODEL, "default"
+        
+        # Every ROUTER_PROBE_EVERY over-budget turns, re-sample the preferred model so it can recover
+        _routing_metrics["over_budget_turns"] += 1
+        if _routing_metrics["over_budget_turns"] % ROUTER_PROBE_EVERY == 0:
+            return preferred, "latency_probe"
+        return fallback, "latency_budget"
+
+def record_model_latency(model: str, latency_s: float, reason: str, success: bool = True):
+    """
+    Update the latency EWMA and routing metrics for a model call.
+    Failed calls (errors, timeouts) count as a full timeout, so a failing model is routed around.
+    """
+    with _router_lock:
+        decisions = _routing_metrics["decisions"]
+        decisions[reason] = decisions.get(reason, 0) + 1
+        
+        stats = _routing_metrics["models"].setdefault(
+            model, {"requests": 0, "errors": 0, "latency_ewma_s": None, "last_latency_s": None}
+        )
+        stats["requests"] += 1
+        stats["last_latency_s"] = round(latency_s, 3)
+        if not success:
+            stats["errors"] += 1
+            latency_s = max(latency_s, LOCAL_LLM_TIMEOUT_S)
+        
+        previous = _model_latency_ewma.get(model)
+        ewma = latency_s if previous is None else ROUTER_EWMA_ALPHA * latency_s + (1 - ROUTER_EWMA_ALPHA) * previous
+        _model_latency_ewma[model] = ewma
+        stats["latency_ewma_s"] = round(ewma, 3)
+
+def get_routing_metrics() -> Dict:
+    """Snapshot of routing decisions and per-model latency."""
+    with _router_lock:
+        return {
+            "decisions": dict(_routing_metrics["decisions"]),
+            "over_budget_turns": _routing_metrics["over_budget_turns"],
+            "models": {model: dict(stats) for model, stats in _routing_metrics["models"].items()},
+        }
+
 def get_local_llm_response(
     user_message: str,
     conversation_context: str = "",
@@ -135,28 +227,41 @@ User message: {user_message}
 
 Provide a therapeutic, empathetic, and helpful response. Be specific and evidence-based. Keep response under 200 words."""
 
-        # Call local LLM API (Ollama format)
+        model, reason = choose_local_model(user_message, mental_health_context)
+        reply = call_local_llm(model, prompt, reason)
+        
+        # The fast model may be missing or failing; never answer worse than the strong model alone
+        if reply is None and model != LOCAL_LLM_STRONG_MODEL:
+            reply = call_local_llm(LOCAL_LLM_STRONG_MODEL, prompt, "fast_model_fallback")
+        return reply
+        
+    except Exception as e:
+        print(f"Local LLM error: {e}")
+        return None
+
+def call_local_llm(model: str, prompt: str, reason: str) -> Optional[str]:
+    """Call the local LLM API (Ollama format) with one model, recording its latency."""
+    started = time.perf_counter()
+    try:
         response = requests.post(
             f"{LOCAL_LLM_URL}/api/generate",
             json={
-                "model": "llama2",  # or "mistral", "phi", etc.
+                "model": model,
                 "prompt": prompt,
                 "stream": False
             },
-            timeout=30
+            timeout=LOCAL_LLM_TIMEOUT_S
         )
-        
-        if response.status_code == 200:
-            return response.json().get("response", "").strip()
-        else:
-            print(f"Local LLM API error: {response.status_code}")
-            return None
-            
     except requests.exceptions.RequestException as e:
-        print(f"Local LLM connection error: {e}")
+        record_model_latency(model, time.perf_counter() - started, reason, success=False)
+        print(f"Local LLM connection error ({model}): {e}")
         return None
-    except Exception as e:
-        print(f"Local LLM error: {e}")
+    record_model_latency(model, time.perf_counter() - started, reason, success=response.status_code == 200)
+    
+    if response.status_code == 200:
+        return response.json().get("response", "").strip()
+    else:
+        print(f"Local LLM API error ({model}): {response.status_code}")
         return None
 
 def get_huggingface_response(
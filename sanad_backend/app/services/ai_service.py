@@ -1,3 +1,19 @@
+import os
+
+# Long inputs are classified as overlapping token windows in one batch
+CLASSIFIER_WINDOW_TOKENS = int(os.getenv("CLASSIFIER_WINDOW_TOKENS", "510"))  # DistilBERT max (512) minus [CLS]/[SEP]
+CLASSIFIER_WINDOW_OVERLAP = int(os.getenv("CLASSIFIER_WINDOW_OVERLAP", "64"))
+CLASSIFIER_BATCH_SIZE = int(os.getenv("CLASSIFIER_BATCH_SIZE", "16"))
+
+if not 0 < CLASSIFIER_WINDOW_TOKENS <= 510:
+    raise ValueError("CLASSIFIER_WINDOW_TOKENS must be between 1 and 510")
+if not 0 <= CLASSIFIER_WINDOW_OVERLAP < CLASSIFIER_WINDOW_TOKENS:
+    raise ValueError("CLASSIFIER_WINDOW_OVERLAP must be at least 0 and less than CLASSIFIER_WINDOW_TOKENS")
+if CLASSIFIER_BATCH_SIZE < 1:
+    raise ValueError("CLASSIFIER_BATCH_SIZE must be at least 1")
+
+CRISIS_KEYWORDS = ["end it all", "suicide", "hurt myself"]
+
 # --- Load Model Once at Startup ---
 try:
     from transformers import pipeline
@@ -9,33 +25,78 @@ except Exception as e:
     print("Backend will run without AI functionality. Please install Visual C++ Redistributables to fix PyTorch.")
     sentiment_model = None
 
+def _risk_from_prediction(label: str, score: float, text: str) -> float:
+    """Simple Risk Logic (Placeholder for Complex NLP logic)"""
+    risk_score = 0.0
+    if label == 'NEGATIVE' and score > 0.8:
+        # Simple keyword check for extreme risk (MUST BE ADVANCED LATER)
+        if any(keyword in text.lower() for keyword in CRISIS_KEYWORDS):
+            risk_score = 0.99  # IMMEDIATE INTERVENTION
+        else:
+            risk_score = score * 0.5  # Moderate Risk
+    return risk_score
+
+def _token_windows(input_ids: list) -> list:
+    """Split token ids into overlapping windows of CLASSIFIER_WINDOW_TOKENS."""
+    step = CLASSIFIER_WINDOW_TOKENS - CLASSIFIER_WINDOW_OVERLAP
+    windows = []
+    for start in range(0, len(input_ids), step):
+        windows.append(input_ids[start:start + CLASSIFIER_WINDOW_TOKENS])
+        if start + CLASSIFIER_WINDOW_TOKENS >= len(input_ids):
+            break
+    return windows
+
+def _classify_windows(windows: list) -> list:
+    """Classify pre-tokenized windows in batches. Returns [(label, score), ...]."""
+    import torch
+
+    tokenizer = sentiment_model.tokenizer
+    model = sentiment_model.model
+    predictions = []
+    for i in range(0, len(windows), CLASSIFIER_BATCH_SIZE):
+        batch = tokenizer.pad(
+            {"input_ids": [tokenizer.build_inputs_with_special_tokens(w) for w in windows[i:i + CLASSIFIER_BATCH_SIZE]]},
+            return_tensors="pt",
+        )
+        batch = {name: tensor.to(model.device) for name, tensor in batch.items()}
+        with torch.no_grad():
+            probs = model(**batch).logits.softmax(dim=-1)
+        scores, label_ids = probs.max(dim=-1)
+        for score, label_id in zip(scores.tolist(), label_ids.tolist()):
+            predictions.append((model.config.id2label[label_id], score))
+    return predictions
+
 def analyze_sentiment_and_risk(text: str) -> dict:
     """Analyzes text for sentiment and estimates risk level."""
     if not sentiment_model:
         # Fallback: Simple keyword-based analysis when AI model is unavailable
         text_lower = text.lower()
-        if any(keyword in text_lower for keyword in ["end it all", "suicide", "hurt myself"]):
+        if any(keyword in text_lower for keyword in CRISIS_KEYWORDS):
             return {"sentiment": "NEGATIVE", "risk_score": 0.99}
         elif any(keyword in text_lower for keyword in ["sad", "depressed", "hopeless", "anxious"]):
             return {"sentiment": "NEGATIVE", "risk_score": 0.5}
         else:
             return {"sentiment": "POSITIVE", "risk_score": 0.0}
 
-    # 1. Run inference
-    result = sentiment_model(text)[0]
-    
-    # 2. Simple Risk Logic (Placeholder for Complex NLP logic)
-    risk_score = 0.0
-    if result['label'] == 'NEGATIVE' and result['score'] > 0.8:
-        # Simple keyword check for extreme risk (MUST BE ADVANCED LATER)
-        if any(keyword in text.lower() for keyword in ["end it all", "suicide", "hurt myself"]):
-            risk_score = 0.99  # IMMEDIATE INTERVENTION
-        else:
-            risk_score = result['score'] * 0.5  # Moderate Risk
+    # 1. Tokenize once and split long messages into overlapping windows
+    input_ids = sentiment_model.tokenizer(text, add_special_tokens=False)["input_ids"]
+    windows = _token_windows(input_ids) or [input_ids]
+
+    # 2. Run inference on all windows as a batch
+    predictions = _classify_windows(windows)
+
+    # 3. Aggregate: the window with the highest risk wins; without any risk, the most negative window
+    best_label, best_risk, best_negativity = None, -1.0, -1.0
+    for window, (label, score) in zip(windows, predictions):
+        window_text = text if len(windows) == 1 else sentiment_model.tokenizer.decode(window)
+        risk_score = _risk_from_prediction(label, score, window_text)
+        negativity = score if label == 'NEGATIVE' else 1 - score
+        if risk_score > best_risk or (risk_score == best_risk and negativity > best_negativity):
+            best_label, best_risk, best_negativity = label, risk_score, negativity
 
     return {
-        "sentiment": result['label'],
-        "risk_score": round(risk_score, 2)
+        "sentiment": best_label,
+        "risk_score": round(best_risk, 2)
     }
 
 def analyze_mental_health_context(text: str) -> dict:
@@ -4,8 +4,11 @@ Stores conversation history and learns patterns from user interactions.
 """
 import json
 import os
+import threading
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+from . import encrypted_log
 
 # Simple file-based storage (in production, use a database)
 STORAGE_DIR = "conversation_data"
@@ -15,54 +18,100 @@ LEARNED_PATTERNS_FILE = os.path.join(STORAGE_DIR, "learned_patterns.json")
 # Ensure storage directory exists
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
-def load_conversation_history(session_id: str) -> List[Dict]:
+# Guards read-modify-write of the JSON files (turns may be persisted from worker threads)
+_store_lock = threading.Lock()
+
+def load_conversation_history(session_id: str, last_n: int = 50) -> List[Dict]:
     """Load conversation history for a session."""
+    if encrypted_log.is_enabled():
+        try:
+            return encrypted_log.read_last_records(session_id, last_n)
+        except (encrypted_log.EncryptedLogError, OSError) as e:
+            print(f"Encrypted history load error: {e}")
+            return []
+
     if not os.path.exists(HISTORY_FILE):
         return []
     
     try:
         with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
             all_history = json.load(f)
-            return all_history.get(session_id, [])
+            return all_history.get(session_id, [])[-last_n:]
     except (json.JSONDecodeError, FileNotFoundError):
         return []
 
 def save_conversation(session_id: str, user_message: str, bot_response: str, context: Dict):
     """Save a conversation turn to history."""
-    if not os.path.exists(HISTORY_FILE):
-        all_history = {}
-    else:
-        try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                all_history = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
+    save_conversation_turns(session_id, [(user_message, bot_response, context)])
+
+def save_conversation_turns(session_id: str, turns: List[Tuple[str, str, Dict]]):
+    """Save several (user_message, bot_response, context) turns with a single history write."""
+    conversation_turns = [
+        {
+            "timestamp": datetime.now().isoformat(),
+            "user_message": user_message,
+            "bot_response": bot_response,
+            "context": context,  # Includes sentiment, risk_score, conditions detected
+        }
+        for user_message, bot_response, context in turns
+    ]
+
+    # Encrypted log: append records instead of rewriting the whole history
+    if encrypted_log.is_enabled():
+        for conversation_turn in conversation_turns:
+            encrypted_log.append_record(session_id, conversation_turn)
+        return
+
+    with _store_lock:
+        if not os.path.exists(HISTORY_FILE):
             all_history = {}
+        else:
+            try:
+                with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+                    all_history = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                all_history = {}
     
-    if session_id not in all_history:
-        all_history[session_id] = []
-    
-    conversation_turn = {
-        "timestamp": datetime.now().isoformat(),
-        "user_message": user_message,
-        "bot_response": bot_response,
-        "context": context,  # Includes sentiment, risk_score, conditions detected
-    }
+        if session_id not in all_history:
+            all_history[session_id] = []
     
-    all_history[session_id].append(conversation_turn)
+        all_history[session_id].extend(conversation_turns)
     
-    # Keep only last 50 conversations per session
-    all_history[session_id] = all_history[session_id][-50:]
+        # Keep only last 50 conversations per session
+        all_history[session_id] = all_history[session_id][-50:]
     
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(all_history, f, indent=2, ensure_ascii=False)
+        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
+            json.dump(all_history, f, indent=2, ensure_ascii=False)
+
+def migrate_plaintext_history() -> int:
+    """
+    One-time move of conversation_history.json into the encrypted log, then delete the plaintext file.
+    Migrated turns are placed before any turns already in a session's encrypted log. Returns the number of sessions.
+    """
+    if not encrypted_log.is_enabled():
+        raise encrypted_log.EncryptedLogError("Encrypted storage is not configured")
+
+    with _store_lock:
+        if not os.path.exists(HISTORY_FILE):
+            return 0
+        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+            all_history = json.load(f)
+
+        for session_id, turns in all_history.items():
+            encrypted_log.rewrite_log(session_id, turns + list(encrypted_log.iter_records(session_id)))
+
+        os.remove(HISTORY_FILE)
+        return len(all_history)
 
 def get_conversation_context(session_id: str, last_n: int = 5) -> str:
     """Get recent conversation context as a string for API prompts."""
-    history = load_conversation_history(session_id)
-    if not history:
+    return format_conversation_context(load_conversation_history(session_id, last_n=last_n))
+
+def format_conversation_context(recent: List[Dict]) -> str:
+    """Format conversation turns as a context string for API prompts."""
+    if not recent:
         return ""
     
-    recent = history[-last_n:]
     context_parts = []
     for turn in recent:
         context_parts.append(f"User: {turn['user_message']}")
@@ -72,37 +121,46 @@ def get_conversation_context(session_id: str, last_n: int = 5) -> str:
 
 def learn_from_conversation(session_id: str, user_message: str, bot_response: str, user_satisfaction: Optional[bool] = None):
     """Learn patterns from conversations (simple pattern extraction)."""
-    if not os.path.exists(LEARNED_PATTERNS_FILE):
-        patterns = {}
-    else:
-        try:
-            with open(LEARNED_PATTERNS_FILE, 'r', encoding='utf-8') as f:
-                patterns = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
+    learn_from_conversation_turns(session_id, [(user_message, bot_response)], user_satisfaction)
+
+def learn_from_conversation_turns(session_id: str, turns: List[Tuple[str, str]], user_satisfaction: Optional[bool] = None):
+    """Learn patterns from several (user_message, bot_response) turns with a single write."""
+    with _store_lock:
+        if not os.path.exists(LEARNED_PATTERNS_FILE):
             patterns = {}
-    
-    # Extract key phrases from user messages
-    key_phrases = extract_key_phrases(user_message)
-    
-    for phrase in key_phrases:
-        if phrase not in patterns:
-            patterns[phrase] = {
-                "count": 0,
-                "successful_responses": [],
-                "contexts": []
-            }
+        else:
+            try:
+                with open(LEARNED_PATTERNS_FILE, 'r', encoding='utf-8') as f:
+                    patterns = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                patterns = {}
+    
+        for user_message, bot_response in turns:
+            # Extract key phrases from user messages
+            key_phrases = extract_key_phrases(user_message)
         
-        patterns[phrase]["count"] += 1
-        if user_satisfaction:
-            patterns[phrase]["successful_responses"].append(bot_response)
-        patterns[phrase]["contexts"].append({
-            "user_msg": user_message,
-            "bot_response": bot_response
-        })
-    
-    # Keep only top patterns
-    with open(LEARNED_PATTERNS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(patterns, f, indent=2, ensure_ascii=False)
+            for phrase in key_phrases:
+                if phrase not in patterns:
+                    patterns[phrase] = {
+                        "count": 0,
+                        "successful_responses": [],
+                        "contexts": []
+                    }
+            
+                patterns[phrase]["count"] += 1
+                # With encrypted storage, only counts are kept so no message text lands here in plaintext
+                if encrypted_log.is_enabled():
+                    continue
+                if user_satisfaction:
+                    patterns[phrase]["successful_responses"].append(bot_response)
+                patterns[phrase]["contexts"].append({
+                    "user_msg": user_message,
+                    "bot_response": bot_response
+                })
+    
+        # Keep only top patterns
+        with open(LEARNED_PATTERNS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(patterns, f, indent=2, ensure_ascii=False)
 
 def extract_key_phrases(text: str) -> List[str]:
     """Extract key phrases from text for learning."""
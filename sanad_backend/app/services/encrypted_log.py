@@ -0,0 +1,322 @@
+"""
+Encrypted conversation log.
+Append-only, per-session log of AES-256-GCM encrypted records.
+
+Each record is framed as:
+
+    [u32 length][u32 seq][u8 key_version][12-byte nonce][ciphertext + tag][u32 length]
+
+The leading length allows forward scans, the trailing copy allows reading the
+last N records by seeking backwards from the end of the file, so appends and
+"recent history" reads never touch the rest of the log. Every record is
+authenticated on its own (the frame header and session id are bound as AAD),
+and per-session keys are derived with HKDF from a versioned master key, so a
+key rotation only affects new appends.
+"""
+import base64
+import hashlib
+import json
+import os
+import struct
+import threading
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except ImportError:
+    AESGCM = None
+
+# Configuration
+# ENCRYPTION_KEYS: comma separated "version:base64key" pairs, e.g. "1:...,2:...".
+# Keys must decode to 32 bytes. The highest version is used for new records.
+ENCRYPTION_KEYS = os.getenv("ENCRYPTION_KEYS", "")
+ENCRYPTED_LOG_DIR = os.path.join("conversation_data", "encrypted")
+
+_LENGTH = struct.Struct(">I")
+_HEADER = struct.Struct(">IB12s")  # seq, key_version, nonce
+_NONCE_SIZE = 12
+_SEALED_AAD_TAG = b"sanad-sealed:"  # Domain separation: a sealed record never authenticates as a log record
+
+_append_lock = threading.Lock()
+
+
+class EncryptedLogError(Exception):
+    """Raised when the encrypted log is misconfigured or a record fails authentication."""
+
+
+def _load_keyring(spec: str) -> Dict[int, bytes]:
+    """Parse ENCRYPTION_KEYS into {version: master_key}."""
+    keyring = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        version, _, encoded = entry.partition(":")
+        key = base64.b64decode(encoded)
+        if len(key) != 32:
+            raise EncryptedLogError(f"Encryption key version {version} must be 32 bytes")
+        if not 0 <= int(version) <= 255:
+            raise EncryptedLogError(f"Encryption key version {version} must be between 0 and 255")
+        keyring[int(version)] = key
+    return keyring
+
+
+KEYRING = _load_keyring(ENCRYPTION_KEYS)
+CURRENT_KEY_VERSION = max(KEYRING) if KEYRING else 0
+
+# Never fall back to plaintext storage when keys were configured
+if KEYRING and AESGCM is None:
+    raise EncryptedLogError("ENCRYPTION_KEYS is set but the cryptography library is not installed (pip install cryptography)")
+
+
+def is_enabled() -> bool:
+    """Whether encrypted storage is configured and usable."""
+    return AESGCM is not None and bool(KEYRING)
+
+
+def _session_file_id(session_id: str) -> str:
+    """Hash the session id so file names do not reveal it."""
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+
+
+def _session_log_path(session_id: str) -> str:
+    return os.path.join(ENCRYPTED_LOG_DIR, f"{_session_file_id(session_id)}.log")
+
+
+@lru_cache(maxsize=1024)
+def _session_key(session_id: str, key_version: int) -> bytes:
+    """Derive the per-session AES-256 key for a master key version."""
+    if key_version not in KEYRING:
+        raise EncryptedLogError(f"Unknown encryption key version {key_version}")
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"sanad-session:" + session_id.encode("utf-8"),
+    )
+    return hkdf.derive(KEYRING[key_version])
+
+
+def _read_frame_at_end(f, end: int) -> Tuple[int, bytes]:
+    """Read the frame that ends at byte offset `end`. Returns (start offset, frame body)."""
+    if end < 2 * _LENGTH.size + _HEADER.size:
+        raise EncryptedLogError("Corrupt encrypted log frame")
+    f.seek(end - _LENGTH.size)
+    (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+    start = end - length - 2 * _LENGTH.size
+    if start < 0 or length < _HEADER.size:
+        raise EncryptedLogError("Corrupt encrypted log frame")
+    f.seek(start)
+    (leading,) = _LENGTH.unpack(f.read(_LENGTH.size))
+    if leading != length:
+        raise EncryptedLogError("Corrupt encrypted log frame")
+    return start, f.read(length)
+
+
+def _valid_end(f, size: int) -> int:
+    """End offset of the last complete frame. A torn tail (crash during a write) is excluded."""
+    if size == 0:
+        return 0
+    try:
+        _read_frame_at_end(f, size)
+        return size
+    except EncryptedLogError:
+        pass
+
+    # Torn tail: scan forward for the last frame whose lengths match
+    end = 0
+    f.seek(0)
+    while True:
+        prefix = f.read(_LENGTH.size)
+        if len(prefix) < _LENGTH.size:
+            break
+        (length,) = _LENGTH.unpack(prefix)
+        frame_end = end + length + 2 * _LENGTH.size
+        if length < _HEADER.size or frame_end > size:
+            break
+        f.seek(frame_end - _LENGTH.size)
+        (trailing,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        if trailing != length:
+            break
+        end = frame_end
+    return end
+
+
+def _decrypt_frame(session_id: str, body: bytes, aad_tag: bytes = b"") -> Dict:
+    header = body[:_HEADER.size]
+    _, key_version, nonce = _HEADER.unpack(header)
+    aad = aad_tag + header + session_id.encode("utf-8")
+    try:
+        plaintext = AESGCM(_session_key(session_id, key_version)).decrypt(nonce, body[_HEADER.size:], aad)
+    except Exception as e:
+        raise EncryptedLogError(f"Encrypted record failed authentication: {e}")
+    return json.loads(plaintext.decode("utf-8"))
+
+
+def _last_seq(f, size: int) -> int:
+    """Sequence number of the last record, or -1 for an empty log."""
+    if size == 0:
+        return -1
+    _, body = _read_frame_at_end(f, size)
+    return _HEADER.unpack(body[:_HEADER.size])[0]
+
+
+def _encrypt_frame(session_id: str, seq: int, record: Dict, aad_tag: bytes = b"") -> bytes:
+    """Encrypt a record into a frame body (header + ciphertext) with the current key."""
+    plaintext = json.dumps(record, ensure_ascii=False).encode("utf-8")
+    nonce = os.urandom(_NONCE_SIZE)
+    header = _HEADER.pack(seq, CURRENT_KEY_VERSION, nonce)
+    key = _session_key(session_id, CURRENT_KEY_VERSION)
+    return header + AESGCM(key).encrypt(nonce, plaintext, aad_tag + header + session_id.encode("utf-8"))
+
+
+def seal(session_id: str, record: Dict) -> bytes:
+    """Encrypt a standalone record (e.g. a state snapshot) for the session."""
+    if not is_enabled():
+        raise EncryptedLogError("Encrypted storage is not configured")
+    return _encrypt_frame(session_id, 0, record, _SEALED_AAD_TAG)
+
+
+def unseal(session_id: str, data: bytes) -> Dict:
+    """Decrypt and authenticate a record produced by seal()."""
+    if not is_enabled():
+        raise EncryptedLogError("Encrypted storage is not configured")
+    return _decrypt_frame(session_id, data, _SEALED_AAD_TAG)
+
+
+def append_record(session_id: str, record: Dict):
+    """Encrypt and append one record to the session log. O(1) in the log size."""
+    if not is_enabled():
+        raise EncryptedLogError("Encrypted storage is not configured")
+
+    path = _session_log_path(session_id)
+    os.makedirs(ENCRYPTED_LOG_DIR, exist_ok=True)
+
+    with _append_lock:
+        with open(path, "a+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            end = _valid_end(f, size)
+            if end != size:
+                print(f"Encrypted log: discarding torn tail of {size - end} bytes")
+                f.truncate(end)
+            body = _encrypt_frame(session_id, _last_seq(f, end) + 1, record)
+            length = _LENGTH.pack(len(body))
+            f.seek(0, os.SEEK_END)
+            f.write(length + body + length)
+
+
+def read_last_records(session_id: str, last_n: int) -> List[Dict]:
+    """
+    Read and decrypt the last `last_n` records, oldest first, without scanning the whole log.
+    Records that cannot be read (corrupt frame, dropped key version) are skipped. Sequence
+    numbers must decrease by one walking backwards; at a gap (a frame was deleted, reordered
+    or duplicated) reading stops, so only the contiguous tail is returned.
+    """
+    if not is_enabled():
+        raise EncryptedLogError("Encrypted storage is not configured")
+
+    path = _session_log_path(session_id)
+    if last_n <= 0 or not os.path.exists(path):
+        return []
+
+    bodies = []
+    expected_seq = None
+    with open(path, "rb") as f:
+        end = _valid_end(f, f.seek(0, os.SEEK_END))
+        while end > 0 and len(bodies) < last_n:
+            try:
+                end, body = _read_frame_at_end(f, end)
+            except EncryptedLogError as e:
+                print(f"Encrypted log read error: {e}")
+                break
+            seq = _HEADER.unpack(body[:_HEADER.size])[0]
+            if expected_seq is not None and seq != expected_seq:
+                print(f"Encrypted log sequence gap: expected record {expected_seq}, found {seq}")
+                break
+            bodies.append(body)
+            expected_seq = seq - 1
+
+    records = []
+    for body in reversed(bodies):
+        try:
+            records.append(_decrypt_frame(session_id, body))
+        except EncryptedLogError as e:
+            print(f"Skipping unreadable encrypted record: {e}")
+    return records
+
+
+def iter_records(session_id: str):
+    """
+    Stream all records of a session log, oldest first. Unreadable records are skipped
+    like in read_last_records; a sequence gap is reported but reading continues.
+    """
+    if not is_enabled():
+        raise EncryptedLogError("Encrypted storage is not configured")
+
+    path = _session_log_path(session_id)
+    if not os.path.exists(path):
+        return
+
+    with open(path, "rb") as f:
+        end = _valid_end(f, f.seek(0, os.SEEK_END))
+        f.seek(0)
+        expected_seq = 0
+        while f.tell() < end:
+            (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+            body = f.read(length)
+            f.read(_LENGTH.size)
+            seq = _HEADER.unpack(body[:_HEADER.size])[0]
+            if seq != expected_seq:
+                print(f"Encrypted log sequence gap: expected record {expected_seq}, found {seq}")
+            expected_seq = seq + 1
+            try:
+                yield _decrypt_frame(session_id, body)
+            except EncryptedLogError as e:
+                print(f"Skipping unreadable encrypted record: {e}")
+
+
+def rewrite_log(session_id: str, records: List[Dict]):
+    """Replace a session log with `records` (renumbered from 0, current key), atomically."""
+    if not is_enabled():
+        raise EncryptedLogError("Encrypted storage is not configured")
+
+    path = _session_log_path(session_id)
+    os.makedirs(ENCRYPTED_LOG_DIR, exist_ok=True)
+
+    with _append_lock:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for seq, record in enumerate(records):
+                body = _encrypt_frame(session_id, seq, record)
+                length = _LENGTH.pack(len(body))
+                f.write(length + body + length)
+        os.replace(tmp_path, path)
+
+
+def _key_versions_in_file(path: str, counts: Dict[int, int]):
+    with open(path, "rb") as f:
+        end = _valid_end(f, f.seek(0, os.SEEK_END))
+        f.seek(0)
+        while f.tell() < end:
+            (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+            _, key_version, _ = _HEADER.unpack(f.read(_HEADER.size))
+            counts[key_version] = counts.get(key_version, 0) + 1
+            f.seek(length - _HEADER.size + _LENGTH.size, os.SEEK_CUR)
+
+
+def key_versions_in_use() -> Dict[int, int]:
+    """
+    Count records per key version across all session logs (headers only, nothing is decrypted).
+    A master key can be dropped from ENCRYPTION_KEYS once its version no longer appears here.
+    """
+    counts: Dict[int, int] = {}
+    if not os.path.isdir(ENCRYPTED_LOG_DIR):
+        return counts
+
+    for entry in os.scandir(ENCRYPTED_LOG_DIR):
+        if entry.name.endswith(".log"):
+            try:
+                _key_versions_in_file(entry.path, counts)
+            except (OSError, struct.error) as e:
+                print(f"Encrypted log audit error ({entry.name}): {e}")
+    return counts
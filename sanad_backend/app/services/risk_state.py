@@ -0,0 +1,222 @@
+"""
+Per-session risk state.
+A small, fixed-size summary of a session's risk history (EWMA of risk, condition
+counts, last crisis time, turn count) that is updated in O(1) per turn instead of
+re-parsing the conversation history, and persisted next to the conversation store.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from . import encrypted_log
+
+# Configuration
+RISK_EWMA_ALPHA = float(os.getenv("RISK_EWMA_ALPHA", "0.3"))
+# Sustained risk that triggers a check-in. Non-crisis scores are at most 0.5 (model: 0.4-0.5, keywords: 0.5),
+# so the threshold must sit below that for a run of moderate-risk turns to reach it
+RISK_ELEVATED_EWMA = float(os.getenv("RISK_ELEVATED_EWMA", "0.35"))
+RISK_RISING_TURNS = int(os.getenv("RISK_RISING_TURNS", "3"))  # Consecutive rising turns that count as a trend
+RISK_CHECK_IN_EVERY = int(os.getenv("RISK_CHECK_IN_EVERY", "5"))  # Minimum turns between check-ins
+RISK_RECENT_CRISIS_S = int(os.getenv("RISK_RECENT_CRISIS_S", str(24 * 3600)))
+RISK_STATE_CACHE_SIZE = int(os.getenv("RISK_STATE_CACHE_SIZE", "1024"))  # Active sessions kept in memory
+
+RISK_STATE_DIR = os.path.join("conversation_data", "risk_state")
+
+
+class RiskState:
+    """Risk summary for one session. Updates are O(1) and guarded by a per-session lock."""
+
+    __slots__ = (
+        "risk_ewma", "last_risk_score", "condition_counts", "last_crisis_at", "turn_count", "rising_turns",
+        "last_check_in_turn", "lock"
+    )
+
+    def __init__(self, risk_ewma: float = 0.0, condition_counts: Optional[Dict[str, int]] = None,
+                 last_crisis_at: Optional[float] = None, turn_count: int = 0, rising_turns: int = 0,
+                 last_check_in_turn: Optional[int] = None, last_risk_score: float = 0.0):
+        self.risk_ewma = risk_ewma  # Starts at 0, so a single message cannot look like sustained risk
+        self.last_risk_score = last_risk_score
+        self.condition_counts = condition_counts or {}  # Bounded by the fixed set of detected conditions
+        self.last_crisis_at = last_crisis_at
+        self.turn_count = turn_count
+        self.rising_turns = rising_turns
+        self.last_check_in_turn = last_check_in_turn
+        self.lock = threading.Lock()
+
+    def update(self, risk_score: float, conditions: List[str], crisis: bool):
+        """Fold one turn into the state."""
+        with self.lock:
+            self.risk_ewma = RISK_EWMA_ALPHA * risk_score + (1 - RISK_EWMA_ALPHA) * self.risk_ewma
+            # Trend on raw scores: the EWMA also climbs while converging to a flat series
+            self.rising_turns = self.rising_turns + 1 if risk_score > self.last_risk_score else 0
+            self.last_risk_score = risk_score
+            for condition in conditions:
+                self.condition_counts[condition] = self.condition_counts.get(condition, 0) + 1
+            if crisis:
+                self.last_crisis_at = time.time()
+            self.turn_count += 1
+
+    def recent_crisis(self) -> bool:
+        return self.last_crisis_at is not None and time.time() - self.last_crisis_at < RISK_RECENT_CRISIS_S
+
+    def should_check_in(self) -> bool:
+        """
+        Sustained or rising risk across turns, even if this message alone is not a crisis.
+        Records the check-in, so it is not repeated within RISK_CHECK_IN_EVERY turns.
+        """
+        with self.lock:
+            elevated = self.risk_ewma >= RISK_ELEVATED_EWMA or (
+                self.rising_turns >= RISK_RISING_TURNS and self.risk_ewma >= RISK_ELEVATED_EWMA / 2
+            )
+            if not elevated:
+                return False
+            if self.last_check_in_turn is not None and self.turn_count - self.last_check_in_turn < RISK_CHECK_IN_EVERY:
+                return False
+            self.last_check_in_turn = self.turn_count
+            return True
+
+    def prompt_summary(self) -> str:
+        """Short description of the session's risk history for API prompts."""
+        with self.lock:
+            if self.turn_count == 0:
+                return ""
+            parts = [f"Session risk level (averaged over {self.turn_count} turns): {self.risk_ewma:.2f}"]
+            if self.rising_turns >= RISK_RISING_TURNS:
+                parts.append("Risk has been rising over the last few messages.")
+            if self.condition_counts:
+                common = sorted(self.condition_counts.items(), key=lambda item: item[1], reverse=True)[:3]
+                parts.append("Recurring concerns: " + ", ".join(f"{name} ({count})" for name, count in common))
+            if self.recent_crisis():
+                parts.append("The user was in crisis earlier in this session.")
+            return "\n".join(parts)
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                "risk_ewma": round(self.risk_ewma, 4),
+                "last_risk_score": self.last_risk_score,
+                "condition_counts": dict(self.condition_counts),
+                "last_crisis_at": (
+                    datetime.fromtimestamp(self.last_crisis_at).isoformat() if self.last_crisis_at else None
+                ),
+                "turn_count": self.turn_count,
+                "rising_turns": self.rising_turns,
+                "last_check_in_turn": self.last_check_in_turn,
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RiskState":
+        last_crisis_at = data.get("last_crisis_at")
+        return cls(
+            risk_ewma=data.get("risk_ewma", 0.0),
+            last_risk_score=data.get("last_risk_score", 0.0),
+            condition_counts=data.get("condition_counts", {}),
+            last_crisis_at=datetime.fromisoformat(last_crisis_at).timestamp() if last_crisis_at else None,
+            turn_count=data.get("turn_count", 0),
+            rising_turns=data.get("rising_turns", 0),
+            last_check_in_turn=data.get("last_check_in_turn"),
+        )
+
+
+_cache_lock = threading.Lock()
+_cache: "OrderedDict[str, RiskState]" = OrderedDict()
+# States held by open WebSocket connections: {session_id: [state, connection count]}.
+# Pinned states are never evicted, so a POST for the same session updates the same object.
+_pinned: Dict[str, list] = {}
+
+
+def _state_path(session_id: str) -> str:
+    file_id = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+    return os.path.join(RISK_STATE_DIR, f"{file_id}.state")  # JSON, or sealed bytes when encrypted
+
+
+def _load_risk_state(session_id: str) -> RiskState:
+    path = _state_path(session_id)
+    if not os.path.exists(path):
+        return RiskState()
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if encrypted_log.is_enabled():
+            return RiskState.from_dict(encrypted_log.unseal(session_id, data))
+        return RiskState.from_dict(json.loads(data.decode("utf-8")))
+    except (json.JSONDecodeError, ValueError, encrypted_log.EncryptedLogError) as e:
+        print(f"Risk state load error: {e}")
+        return RiskState()
+
+
+def _cached_state(session_id: str) -> Optional[RiskState]:
+    """Look up an in-memory state. Caller holds _cache_lock."""
+    if session_id in _pinned:
+        return _pinned[session_id][0]
+    state = _cache.get(session_id)
+    if state is not None:
+        _cache.move_to_end(session_id)
+    return state
+
+
+def get_risk_state(session_id: str) -> RiskState:
+    """Get the session's risk state, from memory if active, otherwise from disk."""
+    with _cache_lock:
+        state = _cached_state(session_id)
+    if state is not None:
+        return state
+
+    # Load outside the lock so a slow read/decrypt does not block other sessions
+    loaded = _load_risk_state(session_id)
+    with _cache_lock:
+        state = _cached_state(session_id)
+        if state is not None:
+            return state  # Another request loaded it first
+        _cache[session_id] = loaded
+        if len(_cache) > RISK_STATE_CACHE_SIZE:
+            _cache.popitem(last=False)
+        return loaded
+
+
+def pin_risk_state(session_id: str) -> RiskState:
+    """Get the session's state and keep it in memory until unpin_risk_state (one call per connection)."""
+    state = get_risk_state(session_id)
+    with _cache_lock:
+        entry = _pinned.get(session_id)
+        if entry is None:
+            # Another connection may have pinned a different copy meanwhile; prefer the pinned one
+            entry = _pinned[session_id] = [_cache.pop(session_id, state), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def unpin_risk_state(session_id: str):
+    """Release a connection's pin; the last release returns the state to the LRU cache."""
+    with _cache_lock:
+        entry = _pinned.get(session_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _pinned[session_id]
+            _cache[session_id] = entry[0]
+            _cache.move_to_end(session_id)
+            if len(_cache) > RISK_STATE_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+
+def save_risk_state(session_id: str, state: RiskState):
+    """Persist a snapshot of the state (one small file per session, replaced atomically)."""
+    snapshot = state.to_dict()
+    os.makedirs(RISK_STATE_DIR, exist_ok=True)
+    if encrypted_log.is_enabled():
+        data = encrypted_log.seal(session_id, snapshot)
+    else:
+        data = json.dumps(snapshot).encode("utf-8")
+
+    path = _state_path(session_id)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
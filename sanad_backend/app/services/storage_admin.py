@@ -0,0 +1,46 @@
+"""
+Maintenance commands for encrypted conversation storage.
+
+Run from sanad_backend/ with ENCRYPTION_KEYS set:
+    python -m app.services.storage_admin audit      # records per key version across all session logs
+    python -m app.services.storage_admin migrate    # move conversation_history.json into the encrypted log
+"""
+import sys
+
+from . import encrypted_log
+from .conversation_store import migrate_plaintext_history
+
+
+def audit():
+    counts = encrypted_log.key_versions_in_use()
+    if not counts:
+        print("No encrypted records found")
+        return
+    for version, count in sorted(counts.items()):
+        status = "current" if version == encrypted_log.CURRENT_KEY_VERSION else "old"
+        if version not in encrypted_log.KEYRING:
+            status = "missing from ENCRYPTION_KEYS, unreadable"
+        print(f"Key version {version}: {count} records ({status})")
+    unused = sorted(set(encrypted_log.KEYRING) - set(counts) - {encrypted_log.CURRENT_KEY_VERSION})
+    if unused:
+        print(f"Safe to drop from ENCRYPTION_KEYS: {', '.join(map(str, unused))}")
+
+
+def migrate():
+    sessions = migrate_plaintext_history()
+    print(f"Migrated {sessions} sessions to the encrypted log")
+
+
+def main():
+    commands = {"audit": audit, "migrate": migrate}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(f"Usage: python -m app.services.storage_admin [{'|'.join(commands)}]")
+        sys.exit(1)
+    if not encrypted_log.is_enabled():
+        print("Encrypted storage is not configured: set ENCRYPTION_KEYS")
+        sys.exit(1)
+    commands[sys.argv[1]]()
+
+
+if __name__ == "__main__":
+    main()
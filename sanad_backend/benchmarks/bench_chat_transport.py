@@ -0,0 +1,76 @@
+"""
+Benchmark: sustained messages per second on one core, POST /message vs. the WebSocket endpoint.
+
+Starts a single uvicorn worker (one core) against a temporary conversation store,
+then sends the same messages over keep-alive HTTP POSTs and over one WebSocket.
+Run from sanad_backend/ (requires `uvicorn`, `httpx` and `websockets`):
+    python -m benchmarks.bench_chat_transport
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+
+PORT = 8765
+MESSAGES = 500
+TEXTS = ["hello", "I feel anxious about work", "ok", "thanks", "I can't sleep at night", "what should I do?"]
+
+
+async def bench_post(session_id):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}") as client:
+        start = time.perf_counter()
+        for i in range(MESSAGES):
+            response = await client.post("/api/v1/message", json={"session_id": session_id, "text": TEXTS[i % len(TEXTS)]})
+            response.raise_for_status()
+        return MESSAGES / (time.perf_counter() - start)
+
+
+async def bench_websocket(session_id):
+    async with websockets.connect(f"ws://127.0.0.1:{PORT}/api/v1/ws/{session_id}") as ws:
+        start = time.perf_counter()
+        for i in range(MESSAGES):
+            await ws.send(json.dumps({"text": TEXTS[i % len(TEXTS)]}))
+            await ws.recv()
+        return MESSAGES / (time.perf_counter() - start)
+
+
+async def wait_for_server():
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"http://127.0.0.1:{PORT}/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+
+async def run():
+    await wait_for_server()
+    print(f"POST /api/v1/message:  {await bench_post('BENCH_POST'):8.1f} msgs/s")
+    print(f"WS   /api/v1/ws/{{id}}:  {await bench_websocket('BENCH_WS'):8.1f} msgs/s")
+
+
+def main():
+    backend_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--workers", "1", "--log-level", "warning"],
+            cwd=workdir,
+            env={**os.environ, "PYTHONPATH": backend_dir},
+        )
+        try:
+            asyncio.run(run())
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
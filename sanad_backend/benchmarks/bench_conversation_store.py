@@ -0,0 +1,58 @@
+"""
+Benchmark: plaintext JSON conversation store vs. encrypted append-only log.
+
+Run from sanad_backend/ (requires `cryptography`):
+    python -m benchmarks.bench_conversation_store
+"""
+import base64
+import os
+import sys
+import tempfile
+import time
+
+TURNS = 500
+READS = 500
+
+
+def run(label, store, session_id):
+    context = {"sentiment": "NEGATIVE", "risk_score": 0.5, "conditions": ["depression"], "severity": "moderate", "concerns": []}
+    message = "I have been feeling low for weeks and can't focus at work. " * 3
+
+    start = time.perf_counter()
+    for i in range(TURNS):
+        store.save_conversation(session_id, f"{message} ({i})", "I'm listening. Tell me more.", context)
+    append_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(READS):
+        store.get_conversation_context(session_id, last_n=5)
+    read_elapsed = time.perf_counter() - start
+
+    print(f"{label:<10} append: {TURNS / append_elapsed:10.1f} turns/s   "
+          f"context read (last 5): {READS / read_elapsed:10.1f} reads/s")
+
+
+def main():
+    os.environ.setdefault("ENCRYPTION_KEYS", "1:" + base64.b64encode(os.urandom(32)).decode())
+    sys.path.insert(0, os.getcwd())
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        from app.services import conversation_store, encrypted_log
+
+        if not encrypted_log.is_enabled():
+            print("Encrypted storage unavailable: install `cryptography` and set ENCRYPTION_KEYS")
+            return
+
+        run("encrypted", conversation_store, "BENCH_ENCRYPTED")
+
+        encrypted_log_enabled = encrypted_log.is_enabled
+        encrypted_log.is_enabled = lambda: False
+        try:
+            run("plaintext", conversation_store, "BENCH_PLAINTEXT")
+        finally:
+            encrypted_log.is_enabled = encrypted_log_enabled
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark: chunked, batched classification of long messages.
+
+Measures analyze_sentiment_and_risk latency for 100-, 1,000- and 5,000-word
+inputs, and checks crisis detection on long messages where the crisis phrase
+appears past the model's 512-token limit. Compared with:
+
+- the previous implementation, which passed the whole message to the pipeline
+  without truncation and raised an error for inputs over 512 tokens
+- truncating to the first 512 tokens (a simpler alternative, never shipped)
+
+Run from sanad_backend/ (requires `transformers` and `torch`):
+    python -m benchmarks.bench_sentiment_chunking
+"""
+import random
+import time
+
+from app.services.ai_service import analyze_sentiment_and_risk, sentiment_model
+
+REPEATS = 5
+
+FILLER = (
+    "Work has been exhausting and I keep replaying conversations from the week. "
+    "My sister called but I did not feel like talking to anyone. "
+    "I tried to go for a walk but it was raining and I just stayed in bed. "
+    "Everything feels heavy and I am tired of pretending that I am fine. "
+)
+CRISIS_PHRASE = "Honestly I just want to end it all, I can't keep going like this. "
+
+
+def make_message(words: int, crisis_at: float = None) -> str:
+    filler = FILLER.split()
+    text = [filler[i % len(filler)] for i in range(words)]
+    if crisis_at is not None:
+        text.insert(int(words * crisis_at), CRISIS_PHRASE)
+    return " ".join(text)
+
+
+def previous_risk(text: str) -> float:
+    """Previous implementation: one pipeline call on the whole message, no truncation."""
+    result = sentiment_model(text)[0]
+    if result["label"] == "NEGATIVE" and result["score"] > 0.8:
+        return 0.99 if "end it all" in text.lower() else result["score"] * 0.5
+    return 0.0
+
+
+def truncated_risk(text: str) -> float:
+    """Alternative (never shipped): only the first 512 tokens are classified and checked for keywords."""
+    result = sentiment_model(text, truncation=True)[0]
+    head = sentiment_model.tokenizer.decode(
+        sentiment_model.tokenizer(text, truncation=True, add_special_tokens=False)["input_ids"]
+    )
+    if result["label"] == "NEGATIVE" and result["score"] > 0.8:
+        return 0.99 if "end it all" in head else result["score"] * 0.5
+    return 0.0
+
+
+def timed(fn, text: str) -> str:
+    try:
+        fn(text)  # warm up
+    except Exception as e:
+        return f"fails ({type(e).__name__})"
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn(text)
+    return f"{(time.perf_counter() - start) / REPEATS * 1000:8.1f} ms"
+
+
+def bench_latency():
+    print(f"{'Latency':<28}{'chunked':>12}{'previous':>22}{'truncated':>12}")
+    for words in (100, 1000, 5000):
+        text = make_message(words)
+        tokens = len(sentiment_model.tokenizer(text, add_special_tokens=False)["input_ids"])
+        print(f"  {words:>5} words ({tokens} tokens)".ljust(28)
+              + f"{timed(analyze_sentiment_and_risk, text):>12}{timed(previous_risk, text):>22}{timed(truncated_risk, text):>12}")
+
+
+def count_detected(fn, corpus) -> str:
+    detected, failed = 0, 0
+    for text in corpus:
+        try:
+            detected += fn(text) >= 0.95
+        except Exception:
+            failed += 1
+    return f"{detected}/{len(corpus)} detected" + (f", {failed} failed" if failed else "")
+
+
+def bench_detection():
+    random.seed(0)
+    corpus = [make_message(random.choice([600, 1500, 3000]), crisis_at=random.uniform(0.3, 0.95)) for _ in range(20)]
+    print("Crisis phrase 30-95% of the way into 600-3,000 word messages:")
+    print(f"  chunked:   {count_detected(lambda text: analyze_sentiment_and_risk(text)['risk_score'], corpus)}")
+    print(f"  previous:  {count_detected(previous_risk, corpus)}")
+    print(f"  truncated: {count_detected(truncated_risk, corpus)}")
+
+
+def main():
+    if sentiment_model is None:
+        print("Sentiment model unavailable: install `transformers` and `torch`")
+        return
+    bench_latency()
+    bench_detection()
+
+
+if __name__ == "__main__":
+    main()
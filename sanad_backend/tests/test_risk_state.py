@@ -0,0 +1,43 @@
+"""
+Session risk state tests.
+
+Run from sanad_backend/:
+    python -m pytest tests
+"""
+from app.services.risk_state import RiskState, RISK_CHECK_IN_EVERY
+
+
+def run_turns(state: RiskState, scores):
+    """Fold turns into the state and return the turn indexes that got a check-in."""
+    check_ins = []
+    for turn, score in enumerate(scores):
+        state.update(score, [], crisis=False)
+        if state.should_check_in():
+            check_ins.append(turn)
+    return check_ins
+
+
+def test_steady_moderate_risk_gets_check_in():
+    # Moderate model risk (score * 0.5) is always below 0.5; a steady run of it must still be noticed
+    check_ins = run_turns(RiskState(), [0.45] * 20)
+    assert check_ins
+    assert check_ins[0] < 10
+    assert all(b - a >= RISK_CHECK_IN_EVERY for a, b in zip(check_ins, check_ins[1:]))
+
+
+def test_keyword_fallback_risk_gets_check_in():
+    assert run_turns(RiskState(), [0.5] * 20)
+
+
+def test_low_risk_gets_no_check_in():
+    assert run_turns(RiskState(), [0.0, 0.2, 0.0, 0.1] * 10) == []
+
+
+def test_single_moderate_message_gets_no_check_in():
+    assert run_turns(RiskState(), [0.45]) == []
+
+
+def test_flat_risk_is_not_rising():
+    state = RiskState()
+    run_turns(state, [0.45] * 10)
+    assert state.rising_turns == 0
@@ -1,6 +1,6 @@
 'use client';
 
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 
 // Define Message Types
 interface Message {
@@ -16,6 +16,9 @@ const ChatInterface: React.FC = () => {
   const [input, setInput] = useState('');
   const [isCrisis, setIsCrisis] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const socketRef = useRef<WebSocket | null>(null);
+  const pendingRef = useRef<string[]>([]);  // Messages sent over the WebSocket and not yet answered
+  const httpQueueRef = useRef<Promise<void>>(Promise.resolve());  // HTTP sends run one at a time, in order
 
   // Auto-scroll to the bottom on new message
   useEffect(() => {
@@ -25,39 +28,92 @@ const ChatInterface: React.FC = () => {
   // NOTE: You would get a unique session ID securely on login/anonymously here
   const sessionId = "ANON_SESSION_123"; 
 
-  const handleSendMessage = async () => {
-    if (input.trim() === '') return;
-
-    const userMessage: Message = { id: Date.now(), sender: 'user', text: input.trim() };
-    setMessages(prev => [...prev, userMessage]);
-    setInput('');
+  // Handles Sanad's reply (same shape over WebSocket and HTTP)
+  const handleResponse = useCallback((data: { response_text: string; action: string }) => {
+    if (data.action === 'EMERGENCY_TRIGGERED') {
+        setIsCrisis(true);
+    }
     
+    // Add Sanad's response
+    const sanadMessage: Message = { 
+        id: Date.now() + 1, 
+        sender: 'sanad', 
+        text: data.response_text 
+    };
+    setMessages(prev => [...prev, sanadMessage]);
+  }, []);
+
+  // API Call to the FastAPI Backend over HTTP (used when the WebSocket is unavailable)
+  const sendOverHttp = useCallback(async (text: string) => {
     try {
-      // API Call to the FastAPI Backend
       const response = await fetch('http://localhost:8000/api/v1/message', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ session_id: sessionId, text: userMessage.text }),
+        body: JSON.stringify({ session_id: sessionId, text }),
       });
 
       const data = await response.json();
-      
-      if (data.action === 'EMERGENCY_TRIGGERED') {
-          setIsCrisis(true);
-      }
-      
-      // Add Sanad's response
-      const sanadMessage: Message = { 
-          id: Date.now() + 1, 
-          sender: 'sanad', 
-          text: data.response_text 
-      };
-      setMessages(prev => [...prev, sanadMessage]);
+      handleResponse(data);
 
     } catch (error) {
       console.error("API Error:", error);
       setMessages(prev => [...prev, { id: Date.now() + 1, sender: 'sanad', text: "I'm having trouble connecting right now. Please try again later." }]);
     }
+  }, [sessionId, handleResponse]);
+
+  // Queue a message for HTTP after any earlier HTTP sends, so replies are shown in the order messages were sent
+  const queueHttp = useCallback((text: string) => {
+    httpQueueRef.current = httpQueueRef.current.then(() => sendOverHttp(text));
+    return httpQueueRef.current;
+  }, [sendOverHttp]);
+
+  // Keep one WebSocket open for the session; the backend holds recent turns in memory.
+  // Replies arrive in order, so unanswered messages are tracked as a queue.
+  useEffect(() => {
+    const socket = new WebSocket(`ws://localhost:8000/api/v1/ws/${sessionId}`);
+    const pending: string[] = [];
+    pendingRef.current = pending;
+
+    socket.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type === 'response') {
+        pending.shift();
+        handleResponse(data);
+      } else if (data.type === 'error') {
+        // The frame was rejected; retry that message over HTTP
+        console.error("WebSocket Error:", data.detail);
+        const text = pending.shift();
+        if (text !== undefined) queueHttp(text);
+      }
+    };
+    // A dropped connection (onerror is always followed by onclose) re-sends unanswered messages over HTTP
+    socket.onclose = () => {
+      if (socketRef.current === socket) socketRef.current = null;
+      pending.splice(0).forEach(text => queueHttp(text));
+    };
+    socketRef.current = socket;
+    return () => {
+      socket.onclose = null;
+      socket.close();
+    };
+  }, [sessionId, handleResponse, queueHttp]);
+
+  const handleSendMessage = async () => {
+    if (input.trim() === '') return;
+
+    const userMessage: Message = { id: Date.now(), sender: 'user', text: input.trim() };
+    setMessages(prev => [...prev, userMessage]);
+    setInput('');
+
+    const socket = socketRef.current;
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      pendingRef.current.push(userMessage.text);
+      socket.send(JSON.stringify({ text: userMessage.text }));
+      return;
+    }
+    
+    // Fallback: HTTP (after any re-sent messages still in flight)
+    await queueHttp(userMessage.text);
   };
   
   // Renders a single message bubble